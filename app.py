@@ -3,38 +3,17 @@ main.py
 """
 
 # Standard library imports
-import glob
-import os
-import time
-from pathlib import Path
-from tempfile import NamedTemporaryFile
 from typing import List, Tuple, Optional
 
 # Third-party imports
 import gradio as gr
-import random
 from loguru import logger
-from pypdf import PdfReader
-from pydub import AudioSegment
-import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util.retry import Retry
-import urllib3
 
 # Local imports
 from constants import (
     APP_TITLE,
-    CHARACTER_LIMIT,
-    ERROR_MESSAGE_NOT_PDF,
-    ERROR_MESSAGE_NO_INPUT,
-    ERROR_MESSAGE_NOT_SUPPORTED_IN_MELO_TTS,
-    ERROR_MESSAGE_READING_PDF,
-    ERROR_MESSAGE_TOO_LONG,
-    GRADIO_CACHE_DIR,
-    GRADIO_CLEAR_CACHE_OLDER_THAN,
-    MELO_TTS_LANGUAGE_MAPPING,
-    NOT_SUPPORTED_IN_MELO_TTS,
-    SUNO_LANGUAGE_MAPPING,
+    EXAMPLE_CACHE_DIR,
+    EXAMPLE_CACHE_REBUILD_AT_STARTUP,
     UI_ALLOW_FLAGGING,
     UI_API_NAME,
     UI_CACHE_EXAMPLES,
@@ -46,113 +25,14 @@ from constants import (
     UI_SHOW_API,
     UI_FLAGGING_MODE,
 )
-from prompts import (
-    LANGUAGE_MODIFIER,
-    LENGTH_MODIFIERS,
-    QUESTION_MODIFIER,
-    SYSTEM_PROMPT,
-    TONE_MODIFIER,
-)
-from schema import ShortDialogue, MediumDialogue
-from utils import generate_podcast_audio, generate_script, parse_url
-
-
-def check_ffmpeg_installation():
-    """检查 ffmpeg 是否已安装且可用"""
-    try:
-        import subprocess
-        import platform
-        
-        # 获取操作系统信息
-        os_name = platform.system().lower()
-        
-        try:
-            # 检查 ffmpeg 是否可用
-            result = subprocess.run(['ffmpeg', '-version'], 
-                                  capture_output=True, 
-                                  text=True, 
-                                  check=True)
-            logger.info(f"ffmpeg found: {result.stdout.split('\\n')[0]}")
-            return
-        except FileNotFoundError:
-            # 根据操作系统提供具体的安装建议
-            if os_name == 'darwin':  # MacOS
-                error_message = """
-ffmpeg 未找到。请按以下步骤安装：
-
-1. 确保已安装 Homebrew：
-   /bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"
-
-2. 安装 ffmpeg：
-   brew install ffmpeg
-
-如果已安装但仍然出错，请尝试：
-   brew update
-   brew upgrade ffmpeg
-
-或重新安装：
-   brew uninstall ffmpeg
-   brew install ffmpeg
-
-安装后，请重新启动终端并再次运行程序。
-"""
-            else:
-                error_message = "请先安装 ffmpeg。\n在 Ubuntu/Debian 上运行: sudo apt-get install ffmpeg\n在 MacOS 上运行: brew install ffmpeg\n在 Windows 上请下载并安装 ffmpeg。"
-            
-            raise gr.Error(error_message)
-            
-    except Exception as e:
-        logger.error(f"检查 ffmpeg 时发生错误: {str(e)}")
-        raise gr.Error(f"检查 ffmpeg 安装时发生错误: {str(e)}")
-
+from coalesce import SingleFlight, request_fingerprint, request_key, voice_number_for
+from example_cache import ExampleCache
+from pipeline import PodcastError, check_ffmpeg_installation, run_podcast_pipeline
 
-def create_robust_session():
-    """创建一个具有重试机制的请求会话"""
-    session = requests.Session()
-    
-    # 配置重试策略
-    retry_strategy = Retry(
-        total=3,  # 最大重试次数
-        backoff_factor=1,  # 重试之间的延迟时间
-        status_forcelist=[500, 502, 503, 504],  # 需要重试的HTTP状态码
-        allowed_methods=["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE", "POST"]
-    )
-    
-    # 配置适配器
-    adapter = HTTPAdapter(max_retries=retry_strategy)
-    session.mount("http://", adapter)
-    session.mount("https://", adapter)
-    
-    return session
+_single_flight = SingleFlight()
+_example_cache = ExampleCache(UI_EXAMPLES)
 
 
-def parse_url(url: str) -> str:
-    """Parse the given URL and return the text content."""
-    try:
-        session = create_robust_session()
-        for attempt in range(3):  # 最多尝试3次
-            try:
-                full_url = f"{JINA_READER_URL}{url}"
-                response = session.get(full_url, timeout=60)
-                response.raise_for_status()
-                return response.text
-            except (requests.RequestException, urllib3.exceptions.ProtocolError) as e:
-                if attempt == 2:  # 最后一次尝试
-                    raise ValueError(f"无法获取URL内容: {str(e)}")
-                time.sleep(2 ** attempt)  # 指数退避
-    except Exception as e:
-        raise ValueError(f"处理URL时出错: {str(e)}")
-
-
-# 错误消息常量
-ERROR_MESSAGES = {
-    "no_input": "请至少上传一个PDF文件或提供一个网址。",
-    "not_pdf": "请上传PDF格式的文件。",
-    "reading_pdf": "读取PDF文件时出错：",
-    "too_long": "文本太长，请缩短内容或分成多个部分处理。",
-    "not_supported": "当前语言在基础音频模式下不支持，请使用高级音频模式。",
-}
-
 def generate_podcast(
     files: List[str],
     url: Optional[str],
@@ -161,130 +41,43 @@ def generate_podcast(
     length: Optional[str],
     language: str,
     use_advanced_audio: bool,
+    target_seconds: Optional[float] = None,
 ) -> Tuple[str, str]:
     """生成播客音频和文字记录"""
     try:
-        check_ffmpeg_installation()
-
-        text = ""
-
-        # Choose random number from 0 to 8
-        random_voice_number = random.randint(0, 8) # this is for suno model
-
-        if not use_advanced_audio and language in NOT_SUPPORTED_IN_MELO_TTS:
-            raise gr.Error(ERROR_MESSAGE_NOT_SUPPORTED_IN_MELO_TTS)
-
-        # 根据语言选择提示词
-        if language in ["中文", "Chinese"]:
-            base_prompt = SYSTEM_PROMPT
-        else:
-            base_prompt = SYSTEM_PROMPT
-            
-        # 修改错误提示
-        if not files and not url:
-            raise gr.Error(ERROR_MESSAGES["no_input"])
-
-        # Process PDFs if any
-        if files:
-            for file in files:
-                if not file.lower().endswith(".pdf"):
-                    raise gr.Error(ERROR_MESSAGES["not_pdf"])
-
-                try:
-                    with Path(file).open("rb") as f:
-                        reader = PdfReader(f)
-                        text += "\n\n".join([page.extract_text() for page in reader.pages])
-                except Exception as e:
-                    raise gr.Error(f"{ERROR_MESSAGES['reading_pdf']} {str(e)}")
-
-        # Process URL if provided
-        if url:
-            try:
-                url_text = parse_url(url)
-                text += "\n\n" + url_text
-            except ValueError as e:
-                raise gr.Error(str(e))
-
-        # Check total character count
-        if len(text) > CHARACTER_LIMIT:
-            raise gr.Error(ERROR_MESSAGES["too_long"])
-
-        # Modify the system prompt based on the user input
-        modified_system_prompt = SYSTEM_PROMPT
-
-        if question:
-            modified_system_prompt += f"\n\n{QUESTION_MODIFIER} {question}"
-        if tone:
-            modified_system_prompt += f"\n\n{TONE_MODIFIER} {tone}."
-        if length:
-            modified_system_prompt += f"\n\n{LENGTH_MODIFIERS[length]}"
-        if language:
-            modified_system_prompt += f"\n\n{LANGUAGE_MODIFIER} {language}."
-
-        # Call the LLM
-        if length == "Short (1-2 min)":
-            llm_output = generate_script(modified_system_prompt, text, ShortDialogue)
-        else:
-            llm_output = generate_script(modified_system_prompt, text, MediumDialogue)
-
-        logger.info(f"Generated dialogue: {llm_output}")
-
-        # Process the dialogue
-        audio_segments = []
-        transcript = ""
-        total_characters = 0
-
-        for line in llm_output.dialogue:
-            logger.info(f"Generating audio for {line.speaker}: {line.text}")
-            if line.speaker == "Host (Jane)":
-                speaker = f"**Host**: {line.text}"
-            else:
-                speaker = f"**{llm_output.name_of_guest}**: {line.text}"
-            transcript += speaker + "\n\n"
-            total_characters += len(line.text)
-
-            language_for_tts = SUNO_LANGUAGE_MAPPING[language]
-
-            if not use_advanced_audio:
-                language_for_tts = MELO_TTS_LANGUAGE_MAPPING[language_for_tts]
-
-            # Get audio file path
-            audio_file_path = generate_podcast_audio(
-                line.text, line.speaker, language_for_tts, use_advanced_audio, random_voice_number
-            )
-            # Read the audio file into an AudioSegment
-            audio_segment = AudioSegment.from_file(audio_file_path)
-            audio_segments.append(audio_segment)
-
-        # Concatenate all audio segments
-        combined_audio = sum(audio_segments)
-
-        # Export the combined audio to a temporary file
-        temporary_directory = GRADIO_CACHE_DIR
-        os.makedirs(temporary_directory, exist_ok=True)
-
-        temporary_file = NamedTemporaryFile(
-            dir=temporary_directory,
-            delete=False,
-            suffix=".mp3",
+        fingerprint = request_fingerprint(
+            files, url, question, tone, length, language, use_advanced_audio
         )
-        combined_audio.export(temporary_file.name, format="mp3")
-
-        # Delete any files in the temp directory that end with .mp3 and are over a day old
-        for file in glob.glob(f"{temporary_directory}*.mp3"):
-            if (
-                os.path.isfile(file)
-                and time.time() - os.path.getmtime(file) > GRADIO_CLEAR_CACHE_OLDER_THAN
-            ):
-                os.remove(file)
-
-        logger.info(f"Generated {total_characters} characters of audio")
-
-        return temporary_file.name, transcript
+        # A target can route the run to MeloTTS, so only requests with the same target share a result
+        key = request_key(fingerprint, target_seconds)
+
+        # Examples are served from the precomputed bundle
+        cached = _example_cache.lookup(key)
+        if cached is not None:
+            logger.info(f"Serving cached example output {cached[0]}")
+            return cached
+
+        # Identical concurrent requests share one run, with a voice fixed by the fingerprint
+        result = _single_flight.do(
+            key,
+            run_podcast_pipeline,
+            files,
+            url,
+            question,
+            tone,
+            length,
+            language,
+            use_advanced_audio,
+            random_voice_number=voice_number_for(fingerprint),
+            target_seconds=target_seconds or None,
+        )
+    except OSError as e:
+        raise gr.Error(f"读取上传文件时出错: {str(e)}")
+    except PodcastError as e:
+        raise gr.Error(str(e))
 
-    except Exception as e:
-        logger.error(f"生成播客时发生错误: {str(e)}")
-        raise gr.Error(f"处理失败: {str(e)}")
+    logger.info(f"Run metadata: {result.metadata}")
+    return result.audio_path, result.transcript
 
 
 demo = gr.Interface(
@@ -323,6 +116,12 @@ demo = gr.Interface(
             label=UI_INPUTS["advanced_audio"]["label"],
             value=UI_INPUTS["advanced_audio"]["value"],
         ),
+        gr.Number(
+            label=UI_INPUTS["target_seconds"]["label"],
+            info=UI_INPUTS["target_seconds"]["info"],
+            value=None,
+            minimum=0,
+        ),
     ],
     outputs=[
         gr.Audio(
@@ -340,4 +139,10 @@ demo = gr.Interface(
 )
 
 if __name__ == "__main__":
-    demo.launch(show_api=UI_SHOW_API)
+    try:
+        check_ffmpeg_installation()  # probe once at startup; later checks hit the cache
+    except PodcastError as e:
+        raise SystemExit(str(e))
+    if EXAMPLE_CACHE_REBUILD_AT_STARTUP:
+        _example_cache.rebuild_in_background()  # only does work when the bundle is stale
+    demo.launch(show_api=UI_SHOW_API, allowed_paths=[EXAMPLE_CACHE_DIR])
@@ -0,0 +1,170 @@
+"""
+batch.py
+
+Generate podcasts in bulk from the command line, without Gradio.
+
+Usage:
+    python batch.py papers/ --output-dir out/ --language English --jobs 4
+    python batch.py manifest.jsonl --output-dir out/
+
+A directory source turns every PDF in it into one podcast. A manifest is a JSON Lines
+file with one item per line, e.g.
+    {"id": "word2vec", "files": ["examples/1310.4546v1.pdf"], "question": "..."}
+    {"id": "hf", "url": "https://en.wikipedia.org/wiki/Hugging_Face", "language": "French"}
+where any of "question", "tone", "length", "language", "advanced_audio" and
+"target_seconds" override the command-line defaults. Each item writes <id><audio suffix>,
+<id>.md (transcript) and <id>.json (run metadata); items whose metadata already exists are
+skipped on re-runs.
+
+Functions:
+- main: Parse the arguments and run the batch.
+- load_items: Load the batch items from a directory or manifest.
+- run_item: Generate the podcast for one item and write its outputs.
+- _is_completed: Check whether an item's outputs already exist.
+"""
+
+# Standard library imports
+import argparse
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+from typing import List, Optional
+
+# Third-party imports
+from loguru import logger
+
+# Local imports
+from constants import AUDIO_CODEC, AUDIO_CODECS, LLM_PRIORITY_BATCH, UI_INPUTS
+
+
+def load_items(source: str, defaults: dict) -> List[dict]:
+    """Load the batch items from a directory of PDFs or a JSON Lines manifest."""
+    source_path = Path(source)
+    if source_path.is_dir():
+        raw_items = [{"id": pdf.stem, "files": [str(pdf)]} for pdf in sorted(source_path.glob("*.pdf"))]
+    else:
+        with source_path.open(encoding="utf-8") as f:
+            raw_items = [json.loads(line) for line in f if line.strip()]
+
+    items = []
+    for index, raw_item in enumerate(raw_items):
+        item = {**defaults, **raw_item}
+        if "file" in item:
+            item["files"] = [item.pop("file")]
+        item.setdefault("files", [])
+        item.setdefault("url", "")
+        item.setdefault("id", f"item-{index:04d}")
+        # Relative paths in a manifest are relative to the manifest itself
+        if not source_path.is_dir():
+            item["files"] = [str(source_path.parent / file) for file in item["files"]]
+        items.append(item)
+    return items
+
+
+def _is_completed(item: dict, output_dir: Path) -> bool:
+    """Check whether an item's outputs already exist."""
+    metadata_path = output_dir / f"{item['id']}.json"
+    if not metadata_path.exists():
+        return False
+    metadata = json.loads(metadata_path.read_text(encoding="utf-8"))
+    return os.path.exists(metadata.get("audio", {}).get("path", ""))
+
+
+def run_item(item: dict, output_dir: Path) -> dict:
+    """Generate the podcast for one item and write its outputs."""
+    from pipeline import run_podcast_pipeline
+
+    audio_path = (output_dir / f"{item['id']}{AUDIO_CODECS[AUDIO_CODEC]['suffix']}").resolve()
+    result = run_podcast_pipeline(
+        item["files"],
+        item["url"],
+        item["question"],
+        item["tone"],
+        item["length"],
+        item["language"],
+        item["advanced_audio"],
+        output_path=str(audio_path),
+        target_seconds=item["target_seconds"],
+        priority=LLM_PRIORITY_BATCH,  # interactive UI requests go ahead of batch work
+    )
+
+    (output_dir / f"{item['id']}.md").write_text(result.transcript, encoding="utf-8")
+    # The metadata is written last (and atomically), so it marks the item as completed
+    metadata_path = output_dir / f"{item['id']}.json"
+    temporary_path = metadata_path.with_suffix(".json.tmp")
+    temporary_path.write_text(
+        json.dumps({"item": item, **result.metadata}, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+    os.replace(temporary_path, metadata_path)
+    return result.metadata
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """Parse the arguments and run the batch."""
+    parser = argparse.ArgumentParser(description="Generate podcasts from a directory of PDFs or a manifest.")
+    parser.add_argument("source", help="directory of PDFs, or a JSON Lines manifest")
+    parser.add_argument("--output-dir", default="batch_output", help="where audio, transcripts and metadata go")
+    parser.add_argument("--question", default="", help="question or topic to focus on")
+    parser.add_argument("--tone", default=UI_INPUTS["tone"]["value"])
+    parser.add_argument("--length", default=UI_INPUTS["length"]["value"])
+    parser.add_argument("--language", default=UI_INPUTS["language"]["value"])
+    parser.add_argument(
+        "--advanced-audio",
+        action=argparse.BooleanOptionalAction,
+        default=UI_INPUTS["advanced_audio"]["value"],
+        help="use Bark (default) instead of MeloTTS",
+    )
+    parser.add_argument(
+        "--target-seconds", type=float, default=None, help="fall back to MeloTTS if Bark would take longer"
+    )
+    parser.add_argument("--jobs", type=int, default=2, help="number of documents processed in parallel")
+    parser.add_argument("--force", action="store_true", help="regenerate items that are already completed")
+    args = parser.parse_args(argv)
+
+    defaults = {
+        "question": args.question,
+        "tone": args.tone,
+        "length": args.length,
+        "language": args.language,
+        "advanced_audio": args.advanced_audio,
+        "target_seconds": args.target_seconds,
+    }
+    output_dir = Path(args.output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    items = load_items(args.source, defaults)
+    pending = [item for item in items if args.force or not _is_completed(item, output_dir)]
+    logger.info(f"{len(items)} items, {len(items) - len(pending)} already completed, {len(pending)} to run")
+    if not pending:
+        return 0
+
+    # Imported here rather than at the top: loading the pipeline preloads the Bark models,
+    # which is not worth doing for --help or a re-run with nothing left to do
+    from pipeline import PodcastError, check_ffmpeg_installation
+
+    try:
+        check_ffmpeg_installation()
+    except PodcastError as e:
+        logger.error(str(e))
+        return 1
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = {executor.submit(run_item, item, output_dir): item for item in pending}
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                metadata = future.result()
+                logger.info(f"Completed {item['id']} in {metadata['elapsed_seconds']}s")
+            except Exception as e:
+                failures += 1
+                logger.error(f"Failed {item['id']}: {str(e)}")
+
+    logger.info(f"Finished: {len(pending) - failures} completed, {failures} failed")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""
+coalesce.py
+
+Single-flight coalescing of identical in-flight podcast requests.
+
+Classes:
+- SingleFlight: Share one computation between concurrent calls with the same key.
+
+Functions:
+- request_fingerprint: Get a stable fingerprint of the normalized podcast inputs.
+- request_key: Get the key under which requests with the same inputs and target are shared.
+- voice_number_for: Get the Bark voice number for a fingerprint.
+- _hash_file: Hash the contents of a file.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Third-party imports
+from loguru import logger
+
+# Local imports
+from constants import COALESCE_RESULT_TTL
+
+
+def _hash_file(path: str) -> str:
+    """Hash the contents of a file, so re-uploads of the same PDF share a fingerprint."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def request_fingerprint(
+    files: Optional[List[str]],
+    url: Optional[str],
+    question: Optional[str],
+    tone: Optional[str],
+    length: Optional[str],
+    language: str,
+    use_advanced_audio: bool,
+) -> str:
+    """Get a stable fingerprint of the normalized podcast inputs."""
+
+    def _normalize(value: Optional[str]) -> str:
+        return " ".join((value or "").split())
+
+    payload = {
+        "files": sorted(_hash_file(file) for file in files or []),
+        "url": _normalize(url),
+        "question": _normalize(question),
+        "tone": _normalize(tone),
+        "length": _normalize(length),
+        "language": _normalize(language),
+        "use_advanced_audio": bool(use_advanced_audio),
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def request_key(fingerprint: str, target_seconds: Optional[float] = None) -> str:
+    """Get the key under which requests are shared: the target can change the backend, so it is part of it."""
+    if not target_seconds:
+        return fingerprint
+    return f"{fingerprint}:{float(target_seconds):g}"
+
+
+def voice_number_for(fingerprint: str) -> int:
+    """Get the Bark voice number (0-8) for a fingerprint, so shared results stay consistent."""
+    return int(fingerprint[:8], 16) % 9
+
+
+class SingleFlight:
+    """Share one computation between concurrent calls with the same key.
+
+    Successful results are also kept for `ttl` seconds, so identical requests that were
+    queued behind the first one (e.g. by the UI's concurrency limit) reuse its result.
+    """
+
+    def __init__(self, ttl: float = COALESCE_RESULT_TTL):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._ttl = ttl
+        self._results: Dict[str, Tuple[float, Any]] = {}  # key -> (expires at, result)
+
+    def do(self, key: str, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        """Run fn, or return the result of the identical call in flight or recently finished."""
+        with self._lock:
+            now = time.monotonic()
+            self._results = {k: v for k, v in self._results.items() if v[0] > now}
+            if key in self._results:
+                logger.info(f"Reusing recent result for request {key[:12]}")
+                return self._results[key][1]
+
+            future = self._calls.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self._calls[key] = future
+
+        if not is_leader:
+            logger.info(f"Joining in-flight request {key[:12]}")
+            return future.result()
+
+        try:
+            result = fn(*args, **kwargs)
+            if self._ttl > 0:
+                with self._lock:
+                    self._results[key] = (time.monotonic() + self._ttl, result)
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            # Waiters see the same failure; the next request with this key starts afresh
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def in_flight(self) -> int:
+        """Get the number of distinct computations currently running."""
+        with self._lock:
+            return len(self._calls)
@@ -8,18 +8,32 @@ from pathlib import Path
 
 # Key constants
 APP_TITLE = "Open NotebookLM 🎙️"
-CHARACTER_LIMIT = 100_000
+TOKEN_LIMIT = 30_000  # measured with DeepSeek's tokenizer after preprocessing
+CHARACTER_LIMIT = 300_000  # raw extracted text, checked before the (costlier) preprocessing
+
+# Bump whenever a change to prompts, preprocessing or synthesis should invalidate cached outputs
+PIPELINE_VERSION = "1"
 
 # Gradio-related constants
 GRADIO_CACHE_DIR = "./gradio_cached_examples/tmp/"
 GRADIO_CLEAR_CACHE_OLDER_THAN = 1 * 24 * 60 * 60  # 1 day
 
+# Audio encoding-related constants
+AUDIO_CODECS = {
+    "mp3": {"encoder": "libmp3lame", "format": "mp3", "suffix": ".mp3"},
+    "opus": {"encoder": "libopus", "format": "ogg", "suffix": ".ogg"},
+    "aac": {"encoder": "aac", "format": "ipod", "suffix": ".m4a"},
+}
+AUDIO_CODEC = os.getenv("AUDIO_CODEC", "mp3")
+AUDIO_BITRATE = os.getenv("AUDIO_BITRATE", "128k")  # e.g. "32k" is plenty for speech with opus
+AUDIO_SAMPLE_RATE = 24_000  # Bark's native rate; MeloTTS output is resampled to match
+
 # Error messages-related constants
 ERROR_MESSAGE_NO_INPUT = "Please provide at least one PDF file or a URL."
 ERROR_MESSAGE_NOT_PDF = "The provided file is not a PDF. Please upload only PDF files."
 ERROR_MESSAGE_NOT_SUPPORTED_IN_MELO_TTS = "The selected language is not supported without advanced audio generation. Please enable advanced audio generation or choose a supported language."
 ERROR_MESSAGE_READING_PDF = "Error reading the PDF file"
-ERROR_MESSAGE_TOO_LONG = "The total content is too long. Please ensure the combined text from PDFs and URL is fewer than {CHARACTER_LIMIT} characters."
+ERROR_MESSAGE_TOO_LONG = "The total content is too long. Please ensure the combined text from PDFs and URL is fewer than {TOKEN_LIMIT} tokens."
 
 # API 调用相关常量
 API_TIMEOUT = 30.0
@@ -35,6 +49,31 @@ DEEPSEEK_MODEL = "deepseek-chat"
 DEEPSEEK_TEMPERATURE = 0.1
 DEEPSEEK_BASE_URL = "https://api.deepseek.com/v1"
 
+# LLM dispatch-related constants
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", "60"))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", "200000"))
+LLM_OUTPUT_TOKENS_ESTIMATE = 1500  # reserved per call until the actual usage is known
+LLM_MAX_ATTEMPTS = 4
+LLM_RETRY_BASE_DELAY = 2  # in seconds, doubled on every retry
+LLM_RETRY_MAX_DELAY = 60  # in seconds, also caps Retry-After
+LLM_RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+LLM_PRIORITY_INTERACTIVE = 0  # lower values are dispatched first
+LLM_PRIORITY_BATCH = 10
+
+# Input preprocessing-related constants
+# DeepSeek's own tokenizer, used to measure prompt size. Ship its tokenizer.json at
+# TOKENIZER_PATH to avoid downloading it from the Hugging Face Hub (TOKENIZER_NAME)
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "deepseek-ai/DeepSeek-V3")
+TOKENIZER_PATH = os.getenv("TOKENIZER_PATH", "tokenizer/tokenizer.json")
+TOKENIZER_RETRY_INTERVAL = 300  # in seconds; token counts are estimated until the tokenizer loads
+PREPROCESS_DROP_BACK_MATTER = True  # drop references/bibliography/appendix sections
+PREPROCESS_DROP_NEAR_DUPLICATES = True
+PREPROCESS_DUPLICATE_THRESHOLD = 0.9  # Jaccard similarity of paragraph shingles
+PREPROCESS_DUPLICATE_WINDOW = 50  # near-duplicates are looked for among this many recent paragraphs
+PREPROCESS_FURNITURE_MIN_PAGES = 3  # repeated headers/footers are only detected on longer documents
+PREPROCESS_FURNITURE_PAGE_RATIO = 0.5  # a line on at least this share of pages is page furniture
+PREPROCESS_FURNITURE_EDGE_LINES = 3  # page numbers and headers/footers are only looked for this close to a page edge
+
 # MeloTTS
 MELO_API_NAME = "/synthesize"
 MELO_TTS_SPACES_ID = "mrfakename/MeloTTS"
@@ -70,6 +109,20 @@ SUNO_LANGUAGE_MAPPING = {
     "Turkish": "tr",
 }
 
+# TTS worker pool-related constants
+TTS_POOL_WORKERS = int(os.getenv("TTS_POOL_WORKERS", "0"))  # 0 disables the pool
+TTS_POOL_THREADS_PER_WORKER = int(os.getenv("TTS_POOL_THREADS_PER_WORKER", "4"))
+TTS_POOL_MAX_JOB_ATTEMPTS = 2  # a job is retried once if its worker crashes
+TTS_POOL_MONITOR_INTERVAL = 1.0  # in seconds
+TTS_POOL_JOB_TIMEOUT = 300  # in seconds; a worker stuck on one line longer than this is killed
+
+# TTS backend routing-related constants
+ROUTER_BARK_SECONDS_PER_CHAR = 0.1  # prior until real Bark timings are observed
+ROUTER_MELO_SECONDS_PER_CHAR = 0.02  # prior until real MeloTTS timings are observed
+ROUTER_MELO_PARALLELISM = 1  # lines are sent to the MeloTTS space one at a time
+ROUTER_EWMA_ALPHA = 0.2  # weight of the newest observation in the latency average
+ROUTER_DECAY_HALF_LIFE = 300  # in seconds; without new samples an estimate relaxes toward the fastest seen
+
 # General audio-related constants
 NOT_SUPPORTED_IN_MELO_TTS = list(
     set(SUNO_LANGUAGE_MAPPING.values()) - set(MELO_TTS_LANGUAGE_MAPPING.keys())
@@ -93,7 +146,7 @@ Built with:
 - [Bark 🐶](https://huggingface.co/suno/bark)
 - [Jina Reader 🔍](https://jina.ai/reader/)
 
-**Note:** Only the text is processed (100k character limits).
+**Note:** Only the text is processed (30k token limit after cleanup).
 """
 UI_AVAILABLE_LANGUAGES = list(set(SUNO_LANGUAGE_MAPPING.keys()))
 UI_INPUTS = {
@@ -129,9 +182,15 @@ UI_INPUTS = {
         "label": "7. 🔄 Use advanced audio generation? (Experimental)",
         "value": True,
     },
+    "target_seconds": {
+        "label": "8. ⏳ 目标完成时间（秒，可选）",
+        "info": "超出时自动改用更快的 MeloTTS（所选语言支持时）",
+    },
 }
 UI_OUTPUTS = {
-    "audio": {"label": "🔊 Podcast", "format": "mp3"},
+    # None serves the encoded file as is; any other format makes Gradio re-encode files
+    # whose suffix differs, undoing the AUDIO_CODEC/AUDIO_BITRATE choice
+    "audio": {"label": "🔊 Podcast", "format": None},
     "transcript": {
         "label": "📜 Transcript",
     },
@@ -139,7 +198,9 @@ UI_OUTPUTS = {
 UI_API_NAME = "generate_podcast"
 UI_ALLOW_FLAGGING = "never"
 UI_FLAGGING_MODE = "never"
-UI_CONCURRENCY_LIMIT = 1
+# With the TTS pool, run as many requests as there are workers; in-process Bark runs one at a time
+UI_CONCURRENCY_LIMIT = int(os.getenv("UI_CONCURRENCY_LIMIT", str(max(1, TTS_POOL_WORKERS))))
+COALESCE_RESULT_TTL = 600  # in seconds; identical requests arriving this soon after a run reuse its result
 UI_EXAMPLES = [
     [
         [str(Path("examples/1310.4546v1.pdf"))],
@@ -149,6 +210,7 @@ UI_EXAMPLES = [
         "Short (1-2 min)",
         "English",
         True,
+        None,
     ],
     [
         [],
@@ -158,6 +220,7 @@ UI_EXAMPLES = [
         "Short (1-2 min)",
         "English",
         False,
+        None,
     ],
     [
         [],
@@ -167,7 +230,13 @@ UI_EXAMPLES = [
         "Short (1-2 min)",
         "English",
         False,
+        None,
     ],
 ]
-UI_CACHE_EXAMPLES = True
+UI_CACHE_EXAMPLES = False  # example outputs come from the EXAMPLE_CACHE_DIR bundle instead
+EXAMPLE_CACHE_DIR = "examples_cached"
+EXAMPLE_CACHE_MANIFEST = "manifest.json"
+# Build the bundle with `python example_cache.py` before deploying; the rebuild at launch
+# only catches up on examples that are missing or outdated, and can be turned off
+EXAMPLE_CACHE_REBUILD_AT_STARTUP = os.getenv("EXAMPLE_CACHE_REBUILD_AT_STARTUP", "1") == "1"
 UI_SHOW_API = True
@@ -0,0 +1,141 @@
+"""
+encoder.py
+
+Encode the podcast by streaming raw PCM into a single ffmpeg process.
+
+Classes:
+- FFmpegCapabilities: Version and available encoders of the local ffmpeg.
+- EncodeResult: Output path, size and timing of an encode.
+
+Functions:
+- probe_ffmpeg: Probe the local ffmpeg once per process.
+- to_pcm16: Convert a float waveform in [-1, 1] to 16-bit PCM samples.
+- read_pcm: Read an audio file as mono 16-bit PCM at the given sample rate.
+- audio_to_pcm: Get the PCM bytes of a line's audio, from samples or from a file.
+- encode_pcm: Stream PCM chunks through ffmpeg into the given output file.
+"""
+
+# Standard library imports
+import os
+import subprocess
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import FrozenSet, Iterable, Union
+
+# Third-party imports
+import numpy as np
+from loguru import logger
+from pydub import AudioSegment
+
+# Local imports
+from constants import AUDIO_BITRATE, AUDIO_CODEC, AUDIO_CODECS, AUDIO_SAMPLE_RATE
+
+
+@dataclass(frozen=True)
+class FFmpegCapabilities:
+    """Version and available encoders of the local ffmpeg."""
+
+    version: str
+    encoders: FrozenSet[str]
+
+
+@dataclass
+class EncodeResult:
+    """Output path, size and timing of an encode."""
+
+    path: str
+    codec: str
+    bitrate: str
+    duration_seconds: float
+    encode_seconds: float
+    size_bytes: int
+
+
+@lru_cache(maxsize=1)
+def probe_ffmpeg() -> FFmpegCapabilities:
+    """Probe the local ffmpeg once per process. Raises FileNotFoundError if it is missing."""
+    version = subprocess.run(
+        ["ffmpeg", "-version"], capture_output=True, text=True, check=True
+    ).stdout.splitlines()[0]
+    listing = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-encoders"], capture_output=True, text=True, check=True
+    ).stdout
+
+    # Encoder lines look like " A....D libmp3lame  libmp3lame MP3 (MPEG audio layer 3)"
+    encoders = frozenset(
+        fields[1]
+        for fields in (line.split() for line in listing.splitlines())
+        if len(fields) > 1 and len(fields[0]) == 6 and fields[0][0] == "A"
+    )
+    logger.info(f"ffmpeg found: {version}")
+    return FFmpegCapabilities(version=version, encoders=encoders)
+
+
+def to_pcm16(audio_array: np.ndarray) -> np.ndarray:
+    """Convert a float waveform in [-1, 1] (as Bark returns it) to 16-bit PCM samples."""
+    return (np.clip(audio_array, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def read_pcm(path: str, sample_rate: int = AUDIO_SAMPLE_RATE) -> bytes:
+    """Read an audio file as mono 16-bit PCM at the given sample rate."""
+    segment = AudioSegment.from_file(path)
+    return segment.set_frame_rate(sample_rate).set_channels(1).set_sample_width(2).raw_data
+
+
+def audio_to_pcm(audio: Union[str, np.ndarray], sample_rate: int = AUDIO_SAMPLE_RATE) -> bytes:
+    """Get the PCM bytes of a line's audio: int16 samples already at the sample rate, or a file to decode."""
+    if isinstance(audio, np.ndarray):
+        return audio.astype(np.int16, copy=False).tobytes()
+    return read_pcm(audio, sample_rate)
+
+
+def encode_pcm(
+    chunks: Iterable[bytes],
+    output_path: str,
+    sample_rate: int = AUDIO_SAMPLE_RATE,
+    codec: str = AUDIO_CODEC,
+    bitrate: str = AUDIO_BITRATE,
+) -> EncodeResult:
+    """Stream mono 16-bit PCM chunks through ffmpeg into the given output file."""
+    codec_settings = AUDIO_CODECS[codec]
+    command = [
+        "ffmpeg", "-hide_banner", "-loglevel", "error", "-y",
+        "-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0",
+        "-c:a", codec_settings["encoder"], "-b:a", bitrate,
+    ]
+    if codec == "opus":
+        command += ["-application", "voip"]  # tuned for speech at low bitrates
+    command += ["-f", codec_settings["format"], output_path]
+
+    start_time = time.time()
+    total_bytes = 0
+    process = subprocess.Popen(command, stdin=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        for chunk in chunks:
+            process.stdin.write(chunk)
+            total_bytes += len(chunk)
+    except BrokenPipeError:
+        pass  # ffmpeg exited early; its stderr below says why
+    except BaseException:
+        process.kill()
+        process.wait()
+        raise
+    _, stderr = process.communicate()
+
+    if process.returncode != 0:
+        raise RuntimeError(f"ffmpeg failed to encode {codec}: {stderr.decode(errors='replace').strip()}")
+
+    result = EncodeResult(
+        path=output_path,
+        codec=codec,
+        bitrate=bitrate,
+        duration_seconds=total_bytes / (2 * sample_rate),
+        encode_seconds=time.time() - start_time,
+        size_bytes=os.path.getsize(output_path),
+    )
+    logger.info(
+        f"Encoded {result.duration_seconds:.1f}s of audio as {codec} at {bitrate} "
+        f"in {result.encode_seconds:.2f}s ({result.size_bytes} bytes)"
+    )
+    return result
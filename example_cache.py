@@ -0,0 +1,199 @@
+"""
+example_cache.py
+
+Precomputed outputs for the UI examples, stored as a versioned bundle under
+EXAMPLE_CACHE_DIR. Build it offline with `python example_cache.py` and ship it with the
+app; it is loaded instantly at startup. Entries that are missing or were built by a
+different pipeline version are rebuilt in a background thread, and an outdated entry keeps
+being served until its replacement has been built.
+
+Classes:
+- ExampleCache: Look up and rebuild the cached example outputs.
+
+Functions:
+- example_key: Get the cache key for a request key and the current pipeline.
+- main: Build the bundle offline.
+"""
+
+# Standard library imports
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+# Third-party imports
+from loguru import logger
+
+# Local imports
+from coalesce import request_fingerprint, request_key, voice_number_for
+from constants import (
+    AUDIO_BITRATE,
+    AUDIO_CODEC,
+    AUDIO_CODECS,
+    DEEPSEEK_MODEL,
+    EXAMPLE_CACHE_DIR,
+    EXAMPLE_CACHE_MANIFEST,
+    LLM_PRIORITY_BATCH,
+    MELO_TTS_SPACES_ID,
+    PIPELINE_VERSION,
+)
+
+
+def example_key(key: str) -> str:
+    """Get the cache key for a request key (see coalesce.request_key) and the current pipeline and models."""
+    payload = {
+        "request": key,
+        "pipeline_version": PIPELINE_VERSION,
+        "llm": DEEPSEEK_MODEL,
+        "melo": MELO_TTS_SPACES_ID,
+        "codec": AUDIO_CODEC,
+        "bitrate": AUDIO_BITRATE,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class ExampleCache:
+    """Look up and rebuild the cached example outputs."""
+
+    def __init__(self, examples: List[list], directory: str = EXAMPLE_CACHE_DIR):
+        self._examples = examples
+        self._directory = Path(directory)
+        self._manifest_path = self._directory / EXAMPLE_CACHE_MANIFEST
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._rebuild_thread: Optional[threading.Thread] = None
+        self.load()
+
+    def load(self) -> None:
+        """Load the bundle manifest, keeping only entries whose audio is present."""
+        try:
+            manifest = json.loads(self._manifest_path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            manifest = {}
+
+        # Entries are keyed by the example's request key and remember the pipeline
+        # key they were built with, so an outdated entry can still be served
+        entries = {
+            key: entry
+            for key, entry in manifest.get("entries", {}).items()
+            if (self._directory / entry["audio"]).exists()
+        }
+        with self._lock:
+            self._entries = entries
+        logger.info(f"Loaded {len(entries)} cached example outputs from {self._manifest_path}")
+
+    def lookup(self, key: str) -> Optional[Tuple[str, str]]:
+        """Get the (audio path, transcript) cached for a request key, if any."""
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["key"] != example_key(key):
+            # Serve the last good output while the background rebuild revalidates it
+            logger.info(f"Serving outdated cached example output {entry['audio']}")
+        return str(self._directory / entry["audio"]), entry["transcript"]
+
+    def _stale_examples(self) -> List[Tuple[str, str, list]]:
+        """Get (request key, fingerprint, example) for every example without a current entry."""
+        stale = []
+        for example in self._examples:
+            fingerprint = request_fingerprint(*example[:7])
+            key = request_key(fingerprint, example[7])
+            with self._lock:
+                entry = self._entries.get(key)
+            if entry is None or entry["key"] != example_key(key):
+                stale.append((key, fingerprint, example))
+        return stale
+
+    def _save(self) -> None:
+        """Write the manifest atomically and remove audio no entry refers to any more."""
+        self._directory.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            manifest = {"pipeline_version": PIPELINE_VERSION, "entries": dict(self._entries)}
+            referenced = {entry["audio"] for entry in self._entries.values()}
+        temporary_path = self._manifest_path.with_suffix(".json.tmp")
+        temporary_path.write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(temporary_path, self._manifest_path)
+
+        suffixes = {codec["suffix"] for codec in AUDIO_CODECS.values()}
+        for path in self._directory.iterdir():
+            if path.suffix in suffixes and path.name not in referenced:
+                path.unlink()
+
+    def rebuild(self) -> int:
+        """Run the pipeline for every stale example and return how many failed.
+
+        An entry is only replaced once its rebuild succeeds; on failure the last good
+        output stays in the bundle and keeps being served.
+        """
+        # Imported here so that loading the cache does not pull in the TTS models
+        from pipeline import run_podcast_pipeline
+
+        self._directory.mkdir(parents=True, exist_ok=True)
+        current = {request_key(request_fingerprint(*example[:7]), example[7]) for example in self._examples}
+        with self._lock:
+            # Examples that were removed from UI_EXAMPLES are dropped; nothing else is
+            self._entries = {key: entry for key, entry in self._entries.items() if key in current}
+
+        failures = 0
+        for key, fingerprint, example in self._stale_examples():
+            entry_key = example_key(key)
+            audio_name = f"{entry_key[:16]}{AUDIO_CODECS[AUDIO_CODEC]['suffix']}"
+            try:
+                result = run_podcast_pipeline(
+                    *example[:7],
+                    output_path=str((self._directory / audio_name).resolve()),
+                    random_voice_number=voice_number_for(fingerprint),
+                    target_seconds=example[7],
+                    priority=LLM_PRIORITY_BATCH,
+                )
+            except Exception as e:
+                # Offline or a failing upstream: keep serving whatever is cached and retry next start
+                failures += 1
+                logger.warning(f"Could not rebuild cached example {example[:7]}: {str(e)}")
+                continue
+
+            with self._lock:
+                self._entries[key] = {
+                    "key": entry_key,
+                    "audio": audio_name,
+                    "transcript": result.transcript,
+                    "inputs": example,
+                    "backend": result.metadata["routing"]["backend"],
+                    "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                }
+            logger.info(f"Cached example output {audio_name}")
+            self._save()
+
+        self._save()
+        return failures
+
+    def rebuild_in_background(self) -> None:
+        """Rebuild stale examples in a daemon thread, if there are any."""
+        if not self._stale_examples():
+            return
+        if self._rebuild_thread is not None and self._rebuild_thread.is_alive():
+            return
+        self._rebuild_thread = threading.Thread(target=self.rebuild, name="example-cache-rebuild", daemon=True)
+        self._rebuild_thread.start()
+
+
+def main() -> int:
+    """Build the bundle offline, e.g. before deploying, so the app never builds it at launch."""
+    from constants import UI_EXAMPLES
+    from pipeline import PodcastError, check_ffmpeg_installation
+
+    try:
+        check_ffmpeg_installation()
+    except PodcastError as e:
+        logger.error(str(e))
+        return 1
+    return 1 if ExampleCache(UI_EXAMPLES).rebuild() else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,208 @@
+"""
+llm_dispatch.py
+
+Client-side rate limiting, priority scheduling and retries for DeepSeek calls.
+
+Classes:
+- TokenBucket: A refilling budget of requests or tokens per minute.
+- LLMDispatcher: Admit calls in priority order within the rate limits and retry retryable failures.
+
+Functions:
+- get_llm_dispatcher: Return the process-wide dispatcher.
+- is_retryable: Check whether a failed call is worth retrying.
+- _retry_after_seconds: Read the Retry-After header of a failed call.
+"""
+
+# Standard library imports
+import heapq
+import itertools
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Callable, Optional
+
+# Third-party imports
+import requests
+from loguru import logger
+
+# Local imports
+from constants import (
+    LLM_MAX_ATTEMPTS,
+    LLM_OUTPUT_TOKENS_ESTIMATE,
+    LLM_PRIORITY_INTERACTIVE,
+    LLM_REQUESTS_PER_MINUTE,
+    LLM_RETRY_BASE_DELAY,
+    LLM_RETRY_MAX_DELAY,
+    LLM_RETRYABLE_STATUS_CODES,
+    LLM_TOKENS_PER_MINUTE,
+)
+from preprocess import count_tokens
+
+
+class TokenBucket:
+    """A refilling budget of requests or tokens per minute. Not thread-safe on its own."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = float(per_minute)
+        self.level = float(per_minute)
+        self._rate = per_minute / 60.0
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self._rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Get the seconds until the amount is available (0 if it is available now)."""
+        self._refill()
+        # A single call larger than the whole bucket only waits for a full bucket
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self._rate)
+
+    def take(self, amount: float) -> None:
+        """Take the amount (negative gives it back); the level may go below zero when settling usage."""
+        self._refill()
+        self.level = min(self.capacity, self.level - amount)
+
+
+def _retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read the Retry-After header (in seconds) of a failed call, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed call is worth retrying: network errors and 429/5xx only."""
+    if isinstance(error, (requests.ConnectionError, requests.Timeout)):
+        return True
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        return error.response.status_code in LLM_RETRYABLE_STATUS_CODES
+    return False
+
+
+class LLMDispatcher:
+    """Admit calls in priority order within the rate limits and retry retryable failures."""
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+    ):
+        self._condition = threading.Condition()
+        self._requests = TokenBucket(requests_per_minute)
+        self._tokens = TokenBucket(tokens_per_minute)
+        self._waiting = []  # heap of (priority, sequence)
+        self._sequence = itertools.count()
+        self._paused_until = 0.0  # set from Retry-After
+        self._metrics = defaultdict(lambda: {"calls": 0, "total_wait_seconds": 0.0, "max_wait_seconds": 0.0})
+        self._retries = 0
+        self._rate_limited = 0
+
+    def _admit(self, tokens: int, priority: int) -> float:
+        """Block until the call may be sent and return how long it waited."""
+        start_time = time.monotonic()
+        ticket = (priority, next(self._sequence))
+        with self._condition:
+            heapq.heappush(self._waiting, ticket)
+            while True:
+                if self._waiting[0] == ticket:
+                    delay = max(
+                        self._paused_until - time.monotonic(),
+                        self._requests.wait_time(1),
+                        self._tokens.wait_time(tokens),
+                    )
+                    if delay <= 0:
+                        self._requests.take(1)
+                        self._tokens.take(tokens)
+                        heapq.heappop(self._waiting)
+                        self._condition.notify_all()
+                        break
+                    self._condition.wait(timeout=delay)
+                else:
+                    self._condition.wait()
+
+            waited = time.monotonic() - start_time
+            metrics = self._metrics[priority]
+            metrics["calls"] += 1
+            metrics["total_wait_seconds"] += waited
+            metrics["max_wait_seconds"] = max(metrics["max_wait_seconds"], waited)
+        if waited > 1:
+            logger.info(f"LLM call (priority {priority}) waited {waited:.1f}s in the dispatch queue")
+        return waited
+
+    def dispatch(
+        self,
+        call: Callable[[str, str], Any],
+        system_prompt: str,
+        text: str,
+        priority: int = LLM_PRIORITY_INTERACTIVE,
+    ) -> Any:
+        """Send call(system_prompt, text) within the rate limits, retrying retryable failures."""
+        estimated_tokens = count_tokens(system_prompt) + count_tokens(text) + LLM_OUTPUT_TOKENS_ESTIMATE
+
+        for attempt in range(LLM_MAX_ATTEMPTS):
+            self._admit(estimated_tokens, priority)
+            try:
+                response = call(system_prompt, text)
+            except Exception as e:
+                # A failed call used none of its reservation; give it back so retries during a
+                # rate-limit episode do not drain the budget several times over
+                with self._condition:
+                    self._tokens.take(-estimated_tokens)
+                    self._condition.notify_all()
+                if not is_retryable(e) or attempt == LLM_MAX_ATTEMPTS - 1:
+                    raise
+
+                retry_after = _retry_after_seconds(e)
+                with self._condition:
+                    self._retries += 1
+                    if retry_after is not None:
+                        # The server says when to come back; hold every caller until then
+                        self._rate_limited += 1
+                        self._paused_until = max(
+                            self._paused_until, time.monotonic() + min(retry_after, LLM_RETRY_MAX_DELAY)
+                        )
+                        self._condition.notify_all()
+                if retry_after is None:
+                    delay = min(LLM_RETRY_BASE_DELAY * 2 ** attempt, LLM_RETRY_MAX_DELAY)
+                    time.sleep(delay * random.uniform(0.5, 1.0))
+                logger.warning(f"LLM call failed ({str(e)}), retrying ({attempt + 1}/{LLM_MAX_ATTEMPTS - 1})")
+                continue
+
+            # Settle the token budget with the usage the API actually reported
+            used_tokens = (response.get("usage") or {}).get("total_tokens") if isinstance(response, dict) else None
+            if used_tokens is not None:
+                with self._condition:
+                    self._tokens.take(used_tokens - estimated_tokens)
+            return response
+
+    def metrics(self) -> dict:
+        """Report queue wait times per priority, retries and rate-limit pauses."""
+        with self._condition:
+            return {
+                "queue_wait": {
+                    priority: {
+                        **values,
+                        "average_wait_seconds": values["total_wait_seconds"] / values["calls"],
+                    }
+                    for priority, values in self._metrics.items()
+                },
+                "waiting": len(self._waiting),
+                "retries": self._retries,
+                "rate_limited": self._rate_limited,
+            }
+
+
+_dispatcher = LLMDispatcher()
+
+
+def get_llm_dispatcher() -> LLMDispatcher:
+    """Return the process-wide dispatcher."""
+    return _dispatcher
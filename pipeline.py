@@ -0,0 +1,349 @@
+"""
+pipeline.py
+
+The podcast generation pipeline, shared by the Gradio app and the batch CLI. Nothing
+in here imports Gradio; user-facing failures are raised as PodcastError.
+
+Classes:
+- PodcastError: A failure with a message suitable for showing to the user.
+- PodcastResult: Audio path, transcript and run metadata of a generated podcast.
+
+Functions:
+- run_podcast_pipeline: Extract, script, synthesize and encode a podcast.
+- check_ffmpeg_installation: Check that ffmpeg is installed and supports the selected codec.
+- create_robust_session: Create a requests session with retries.
+- parse_url: Parse the given URL and return the text content.
+"""
+
+# Standard library imports
+import glob
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from tempfile import NamedTemporaryFile
+from typing import List, Optional
+
+# Third-party imports
+import requests
+import urllib3
+from loguru import logger
+from pypdf import PdfReader
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Local imports
+from constants import (
+    AUDIO_CODEC,
+    AUDIO_CODECS,
+    CHARACTER_LIMIT,
+    ERROR_MESSAGE_NOT_SUPPORTED_IN_MELO_TTS,
+    GRADIO_CACHE_DIR,
+    GRADIO_CLEAR_CACHE_OLDER_THAN,
+    JINA_READER_URL,
+    LLM_PRIORITY_INTERACTIVE,
+    MELO_TTS_LANGUAGE_MAPPING,
+    NOT_SUPPORTED_IN_MELO_TTS,
+    SUNO_LANGUAGE_MAPPING,
+    TOKEN_LIMIT,
+)
+from encoder import audio_to_pcm, encode_pcm, probe_ffmpeg
+from llm_dispatch import get_llm_dispatcher
+from preprocess import count_tokens, prepare_input
+from router import get_router
+from prompts import (
+    LANGUAGE_MODIFIER,
+    LENGTH_MODIFIERS,
+    QUESTION_MODIFIER,
+    SYSTEM_PROMPT,
+    TONE_MODIFIER,
+)
+from schema import ShortDialogue, MediumDialogue
+from utils import generate_podcast_audio_batch, generate_script
+
+
+class PodcastError(Exception):
+    """A failure with a message suitable for showing to the user."""
+
+
+@dataclass
+class PodcastResult:
+    """Audio path, transcript and run metadata of a generated podcast."""
+
+    audio_path: str
+    transcript: str
+    metadata: dict = field(default_factory=dict)
+
+
+def check_ffmpeg_installation():
+    """检查 ffmpeg 是否已安装且支持所选编码器（探测结果在进程内缓存）"""
+    try:
+        import platform
+
+        # 获取操作系统信息
+        os_name = platform.system().lower()
+
+        try:
+            capabilities = probe_ffmpeg()
+        except FileNotFoundError:
+            # 根据操作系统提供具体的安装建议
+            if os_name == 'darwin':  # MacOS
+                error_message = """
+ffmpeg 未找到。请按以下步骤安装：
+
+1. 确保已安装 Homebrew：
+   /bin/bash -c "$(curl -fsSL https://raw.githubusercontent.com/Homebrew/install/HEAD/install.sh)"
+
+2. 安装 ffmpeg：
+   brew install ffmpeg
+
+如果已安装但仍然出错，请尝试：
+   brew update
+   brew upgrade ffmpeg
+
+或重新安装：
+   brew uninstall ffmpeg
+   brew install ffmpeg
+
+安装后，请重新启动终端并再次运行程序。
+"""
+            else:
+                error_message = "请先安装 ffmpeg。\n在 Ubuntu/Debian 上运行: sudo apt-get install ffmpeg\n在 MacOS 上运行: brew install ffmpeg\n在 Windows 上请下载并安装 ffmpeg。"
+            
+            raise PodcastError(error_message)
+
+        encoder = AUDIO_CODECS[AUDIO_CODEC]["encoder"]
+        if encoder not in capabilities.encoders:
+            raise PodcastError(f"当前 ffmpeg 不支持 {AUDIO_CODEC} 编码器 {encoder}，请更换 AUDIO_CODEC 或重新安装 ffmpeg。")
+        return capabilities
+
+    except PodcastError:
+        raise
+    except Exception as e:
+        logger.error(f"检查 ffmpeg 时发生错误: {str(e)}")
+        raise PodcastError(f"检查 ffmpeg 安装时发生错误: {str(e)}")
+
+
+def create_robust_session():
+    """创建一个具有重试机制的请求会话"""
+    session = requests.Session()
+    
+    # 配置重试策略
+    retry_strategy = Retry(
+        total=3,  # 最大重试次数
+        backoff_factor=1,  # 重试之间的延迟时间
+        status_forcelist=[500, 502, 503, 504],  # 需要重试的HTTP状态码
+        allowed_methods=["HEAD", "GET", "PUT", "DELETE", "OPTIONS", "TRACE", "POST"]
+    )
+    
+    # 配置适配器
+    adapter = HTTPAdapter(max_retries=retry_strategy)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    
+    return session
+
+
+def parse_url(url: str) -> str:
+    """Parse the given URL and return the text content."""
+    try:
+        session = create_robust_session()
+        for attempt in range(3):  # 最多尝试3次
+            try:
+                full_url = f"{JINA_READER_URL}{url}"
+                response = session.get(full_url, timeout=60)
+                response.raise_for_status()
+                return response.text
+            except (requests.RequestException, urllib3.exceptions.ProtocolError) as e:
+                if attempt == 2:  # 最后一次尝试
+                    raise ValueError(f"无法获取URL内容: {str(e)}")
+                time.sleep(2 ** attempt)  # 指数退避
+    except Exception as e:
+        raise ValueError(f"处理URL时出错: {str(e)}")
+
+
+# 错误消息常量
+ERROR_MESSAGES = {
+    "no_input": "请至少上传一个PDF文件或提供一个网址。",
+    "not_pdf": "请上传PDF格式的文件。",
+    "reading_pdf": "读取PDF文件时出错：",
+    "too_long_raw": f"文本太长（超过 {CHARACTER_LIMIT} 个字符），请缩短内容或分成多个部分处理。",
+    "too_long": f"文本太长（清理后超过 {TOKEN_LIMIT} 个 token），请缩短内容或分成多个部分处理。",
+    "not_supported": "当前语言在基础音频模式下不支持，请使用高级音频模式。",
+}
+
+def run_podcast_pipeline(
+    files: List[str],
+    url: Optional[str],
+    question: Optional[str],
+    tone: Optional[str],
+    length: Optional[str],
+    language: str,
+    use_advanced_audio: bool,
+    output_path: Optional[str] = None,
+    random_voice_number: Optional[int] = None,
+    target_seconds: Optional[float] = None,
+    priority: int = LLM_PRIORITY_INTERACTIVE,
+) -> PodcastResult:
+    """生成播客音频和文字记录，不依赖 Gradio，供界面和批处理命令共用"""
+    try:
+        check_ffmpeg_installation()
+        start_time = time.time()
+
+        # Choose random number from 0 to 8, unless the caller fixed the voice
+        if random_voice_number is None:
+            random_voice_number = random.randint(0, 8) # this is for suno model
+
+        if not use_advanced_audio and language in NOT_SUPPORTED_IN_MELO_TTS:
+            raise PodcastError(ERROR_MESSAGE_NOT_SUPPORTED_IN_MELO_TTS)
+
+        # 根据语言选择提示词
+        if language in ["中文", "Chinese"]:
+            base_prompt = SYSTEM_PROMPT
+        else:
+            base_prompt = SYSTEM_PROMPT
+            
+        # 修改错误提示
+        if not files and not url:
+            raise PodcastError(ERROR_MESSAGES["no_input"])
+
+        # Collect the pages of each source, so page furniture is detected per document
+        documents = []
+
+        # Process PDFs if any
+        if files:
+            for file in files:
+                if not file.lower().endswith(".pdf"):
+                    raise PodcastError(ERROR_MESSAGES["not_pdf"])
+
+                try:
+                    with Path(file).open("rb") as f:
+                        reader = PdfReader(f)
+                        documents.append([page.extract_text() for page in reader.pages])
+                except Exception as e:
+                    raise PodcastError(f"{ERROR_MESSAGES['reading_pdf']} {str(e)}")
+
+        # Process URL if provided
+        if url:
+            try:
+                url_text = parse_url(url)
+                documents.append([url_text])
+            except ValueError as e:
+                raise PodcastError(str(e))
+
+        # Clean up the extracted text and check its size in model tokens
+        raw_characters = sum(len(page) for pages in documents for page in pages)
+        if raw_characters > CHARACTER_LIMIT:
+            raise PodcastError(ERROR_MESSAGES["too_long_raw"])
+        text = "\n\n".join(prepare_input(pages) for pages in documents)
+        total_tokens = count_tokens(text)
+        logger.info(f"Prepared input: {raw_characters} -> {len(text)} characters, {total_tokens} tokens")
+
+        if total_tokens > TOKEN_LIMIT:
+            raise PodcastError(ERROR_MESSAGES["too_long"])
+
+        # Modify the system prompt based on the user input
+        modified_system_prompt = SYSTEM_PROMPT
+
+        if question:
+            modified_system_prompt += f"\n\n{QUESTION_MODIFIER} {question}"
+        if tone:
+            modified_system_prompt += f"\n\n{TONE_MODIFIER} {tone}."
+        if length:
+            modified_system_prompt += f"\n\n{LENGTH_MODIFIERS[length]}"
+        if language:
+            modified_system_prompt += f"\n\n{LANGUAGE_MODIFIER} {language}."
+
+        # Call the LLM
+        if length == "Short (1-2 min)":
+            llm_output = generate_script(modified_system_prompt, text, ShortDialogue, priority)
+        else:
+            llm_output = generate_script(modified_system_prompt, text, MediumDialogue, priority)
+
+        logger.info(f"Generated dialogue: {llm_output}")
+
+        # Process the dialogue
+        transcript = ""
+        total_characters = 0
+
+        for line in llm_output.dialogue:
+            if line.speaker == "Host (Jane)":
+                speaker = f"**Host**: {line.text}"
+            else:
+                speaker = f"**{llm_output.name_of_guest}**: {line.text}"
+            transcript += speaker + "\n\n"
+            total_characters += len(line.text)
+
+        # Pick the TTS backend, falling back to MeloTTS if Bark would miss the target time
+        language_for_tts = SUNO_LANGUAGE_MAPPING[language]
+        router = get_router()
+        remaining_seconds = target_seconds - (time.time() - start_time) if target_seconds else None
+        routing = router.choose(language_for_tts, total_characters, use_advanced_audio, remaining_seconds)
+
+        if not routing.use_advanced_audio:
+            language_for_tts = MELO_TTS_LANGUAGE_MAPPING[language_for_tts]
+
+        # Get each line's audio: Bark PCM samples (synthesized across the TTS worker pool
+        # when enabled) or MeloTTS files
+        logger.info(f"Generating audio for {len(llm_output.dialogue)} lines with {routing.backend}")
+        with router.track(routing.backend, total_characters):
+            audio_lines = generate_podcast_audio_batch(
+                [(line.text, line.speaker) for line in llm_output.dialogue],
+                language_for_tts,
+                routing.use_advanced_audio,
+                random_voice_number,
+            )
+
+        # Export the combined audio, streaming the PCM of each line into ffmpeg
+        temporary_directory = GRADIO_CACHE_DIR
+        os.makedirs(temporary_directory, exist_ok=True)
+
+        if output_path is None:
+            temporary_file = NamedTemporaryFile(
+                dir=temporary_directory,
+                delete=False,
+                suffix=AUDIO_CODECS[AUDIO_CODEC]["suffix"],
+            )
+            output_path = temporary_file.name
+        try:
+            encode_result = encode_pcm((audio_to_pcm(audio) for audio in audio_lines), output_path)
+        finally:
+            # The per-line MeloTTS files are not needed once the podcast is encoded
+            for audio in audio_lines:
+                if isinstance(audio, str) and os.path.isfile(audio):
+                    os.remove(audio)
+
+        # Delete any audio files in the temp directory that are over a day old
+        for suffix in {codec["suffix"] for codec in AUDIO_CODECS.values()} | {".wav"}:
+            for file in glob.glob(f"{temporary_directory}*{suffix}"):
+                if (
+                    os.path.isfile(file)
+                    and time.time() - os.path.getmtime(file) > GRADIO_CLEAR_CACHE_OLDER_THAN
+                ):
+                    os.remove(file)
+
+        logger.info(
+            f"Generated {total_characters} characters of audio "
+            f"({encode_result.codec}, {encode_result.size_bytes} bytes, encoded in {encode_result.encode_seconds:.2f}s)"
+        )
+
+        metadata = {
+            "language": language,
+            "use_advanced_audio": use_advanced_audio,
+            "voice_number": random_voice_number,
+            "input_tokens": total_tokens,
+            "dialogue_lines": len(llm_output.dialogue),
+            "total_characters": total_characters,
+            "routing": asdict(routing),
+            "audio": asdict(encode_result),
+            "llm_dispatch": get_llm_dispatcher().metrics(),
+            "elapsed_seconds": round(time.time() - start_time, 2),
+        }
+        return PodcastResult(audio_path=output_path, transcript=transcript, metadata=metadata)
+
+    except PodcastError:
+        raise
+    except Exception as e:
+        logger.error(f"生成播客时发生错误: {str(e)}")
+        raise PodcastError(f"处理失败: {str(e)}") from e
@@ -0,0 +1,234 @@
+"""
+preprocess.py
+
+Clean up extracted text before it is sent to the LLM, and measure it in model tokens.
+
+Functions:
+- prepare_input: Run the full cleanup pipeline over the pages of one document.
+- count_tokens: Count the tokens in the given text with a local tokenizer.
+- normalize_whitespace: Collapse runs of spaces and blank lines.
+- remove_page_furniture: Drop page numbers and headers/footers repeated across pages.
+- dehyphenate: Re-join words split across line breaks.
+- drop_back_matter: Drop the references/bibliography/appendix sections.
+- drop_near_duplicate_paragraphs: Drop paragraphs that repeat an earlier one.
+- _get_tokenizer: Load DeepSeek's tokenizer once it is available.
+- _shingles: Get the word (or, for CJK, character) 3-gram shingles of a paragraph.
+"""
+
+# Standard library imports
+import os
+import re
+import threading
+import time
+from collections import Counter, deque
+from typing import List
+
+# Third-party imports
+from loguru import logger
+
+# Local imports
+from constants import (
+    PREPROCESS_DROP_BACK_MATTER,
+    PREPROCESS_DROP_NEAR_DUPLICATES,
+    PREPROCESS_DUPLICATE_THRESHOLD,
+    PREPROCESS_DUPLICATE_WINDOW,
+    PREPROCESS_FURNITURE_EDGE_LINES,
+    PREPROCESS_FURNITURE_MIN_PAGES,
+    PREPROCESS_FURNITURE_PAGE_RATIO,
+    TOKENIZER_NAME,
+    TOKENIZER_PATH,
+    TOKENIZER_RETRY_INTERVAL,
+)
+
+PAGE_NUMBER_PATTERN = re.compile(
+    r"^\s*(?:page\s*)?[-–—]?\s*\d{1,4}\s*[-–—]?(?:\s*(?:of|/)\s*\d{1,4})?\s*$|^\s*第\s*\d+\s*页\s*$",
+    re.IGNORECASE,
+)
+BACK_MATTER_PATTERN = re.compile(
+    r"^\s*(?:#{1,6}\s*)?(?:\*\*|__)?\s*(?:(?:\d+|[IVX]+)\.?\s+)?"
+    r"(?:references|bibliography|works cited|appendices|appendix(?:\s+[A-Z\d])?(?:\s*[:.].{0,40})?|参考文献|附录)"
+    r"\s*:?\s*(?:\*\*|__)?\s*$",
+    re.IGNORECASE | re.MULTILINE,
+)
+# pypdf separates lines with single newlines, so a line break after sentence-ending
+# punctuation (optionally followed by a closing quote or bracket) also ends a paragraph
+PARAGRAPH_BREAK_PATTERN = re.compile(r"(\n{2,}|(?:(?<=[.!?。！？])|(?<=[.!?。！？][\"'”’)\]]))\n)")
+CJK_PATTERN = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af]")
+
+
+def prepare_input(
+    pages: List[str],
+    drop_back_matter_sections: bool = PREPROCESS_DROP_BACK_MATTER,
+    drop_duplicates: bool = PREPROCESS_DROP_NEAR_DUPLICATES,
+) -> str:
+    """Run the full cleanup pipeline over the pages of one document."""
+    pages = [normalize_whitespace(page) for page in pages]
+    text = "\n\n".join(remove_page_furniture(pages))
+    text = dehyphenate(text)
+
+    if drop_back_matter_sections:
+        text = drop_back_matter(text)
+    if drop_duplicates:
+        text = drop_near_duplicate_paragraphs(text)
+
+    return normalize_whitespace(text)
+
+
+_tokenizer = None
+_tokenizer_retry_at = 0.0
+_tokenizer_lock = threading.Lock()
+
+
+def _get_tokenizer():
+    """Load DeepSeek's tokenizer, or return None while it is unavailable (retried every TOKENIZER_RETRY_INTERVAL)."""
+    global _tokenizer, _tokenizer_retry_at
+    with _tokenizer_lock:
+        if _tokenizer is None and time.monotonic() >= _tokenizer_retry_at:
+            try:
+                from tokenizers import Tokenizer
+
+                if os.path.exists(TOKENIZER_PATH):
+                    _tokenizer = Tokenizer.from_file(TOKENIZER_PATH)
+                else:
+                    _tokenizer = Tokenizer.from_pretrained(TOKENIZER_NAME)
+                logger.info(f"Loaded tokenizer {TOKENIZER_NAME}")
+            except Exception as e:
+                # Not cached: a later call retries, e.g. once the network is back
+                _tokenizer_retry_at = time.monotonic() + TOKENIZER_RETRY_INTERVAL
+                logger.warning(f"Tokenizer {TOKENIZER_NAME} unavailable, estimating token counts: {e}")
+        return _tokenizer
+
+
+def count_tokens(text: str) -> int:
+    """Count the tokens in the given text with a local tokenizer."""
+    tokenizer = _get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+
+    # Fallback estimate: roughly one token per CJK character and 1.3 per other word
+    cjk_characters = len(CJK_PATTERN.findall(text))
+    words = len(CJK_PATTERN.sub(" ", text).split())
+    return cjk_characters + int(words * 1.3)
+
+
+def normalize_whitespace(text: str) -> str:
+    """Collapse runs of spaces and blank lines."""
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    text = re.sub(r"[ \t\u00a0\u3000\f\v]+", " ", text)
+    text = re.sub(r" *\n *", "\n", text)
+    text = re.sub(r"\n{3,}", "\n\n", text)
+    return text.strip()
+
+
+def remove_page_furniture(pages: List[str]) -> List[str]:
+    """Drop page numbers and headers/footers repeated across pages.
+
+    Only the first and last PREPROCESS_FURNITURE_EDGE_LINES lines of each page are
+    candidates, and single-page sources (e.g. a web page) are returned unchanged, so
+    number-only lines in the body text (years, figures) are kept.
+    """
+    if len(pages) < 2:
+        return pages
+
+    def _key(line: str) -> str:
+        # Running headers often carry the page number, so compare with digits masked
+        return re.sub(r"\d+", "#", line.strip().lower())
+
+    def _edge_indexes(lines: List[str]) -> set:
+        return set(range(min(PREPROCESS_FURNITURE_EDGE_LINES, len(lines)))) | set(
+            range(max(len(lines) - PREPROCESS_FURNITURE_EDGE_LINES, 0), len(lines))
+        )
+
+    page_lines = [page.splitlines() for page in pages]
+    repeated = set()
+    if len(pages) >= PREPROCESS_FURNITURE_MIN_PAGES:
+        counts = Counter(
+            key
+            for lines in page_lines
+            for key in {_key(lines[i]) for i in _edge_indexes(lines) if 0 < len(lines[i].strip()) <= 80}
+        )
+        min_pages = max(2, int(len(pages) * PREPROCESS_FURNITURE_PAGE_RATIO))
+        repeated = {key for key, count in counts.items() if count >= min_pages}
+
+    cleaned_pages = []
+    for lines in page_lines:
+        edges = _edge_indexes(lines)
+        kept = [
+            line
+            for i, line in enumerate(lines)
+            if i not in edges or not (PAGE_NUMBER_PATTERN.match(line) or _key(line) in repeated)
+        ]
+        cleaned_pages.append("\n".join(kept))
+    return cleaned_pages
+
+
+def dehyphenate(text: str) -> str:
+    """Re-join words split across line breaks.
+
+    A word is only joined when the joined form appears elsewhere in the text; otherwise
+    the hyphen is a real one ("well-\nknown", "state-\nof-the-art") and only the line
+    break is dropped.
+    """
+    vocabulary = set(re.findall(r"[a-z]+", text.lower()))
+
+    def _join(match: re.Match) -> str:
+        first, second = match.group(1), match.group(2)
+        if (first + second).lower() in vocabulary:
+            return first + second
+        return f"{first}-{second}"
+
+    return re.sub(r"([A-Za-z]+)-\n([a-z]+)", _join, text)
+
+
+def drop_back_matter(text: str) -> str:
+    """Drop the references/bibliography/appendix sections."""
+    # Only headings in the latter part of the document count, so a table of
+    # contents or an "Appendix A shows..." in the introduction is left alone
+    for match in BACK_MATTER_PATTERN.finditer(text):
+        if match.start() > len(text) * 0.3:
+            logger.info(f"Dropping back matter from '{match.group().strip()}' ({len(text) - match.start()} characters)")
+            return text[: match.start()]
+    return text
+
+
+def _shingles(paragraph: str) -> set:
+    """Get the word (or, for CJK, character) 3-gram shingles of a paragraph."""
+    tokens = CJK_PATTERN.findall(paragraph) + re.findall(r"\w+", CJK_PATTERN.sub(" ", paragraph.lower()))
+    return {tuple(tokens[i : i + 3]) for i in range(max(len(tokens) - 2, 1))}
+
+
+def drop_near_duplicate_paragraphs(
+    text: str,
+    threshold: float = PREPROCESS_DUPLICATE_THRESHOLD,
+    window: int = PREPROCESS_DUPLICATE_WINDOW,
+) -> str:
+    """Drop paragraphs that repeat an earlier one.
+
+    Exact repeats (ignoring case and whitespace) are caught anywhere in the text; near
+    duplicates only among the last `window` kept paragraphs, which keeps this linear.
+    """
+    # Split on paragraph breaks, keeping each break so the kept text is reassembled as it was
+    parts = PARAGRAPH_BREAK_PATTERN.split(text)
+    kept, seen, recent_shingles = [], set(), deque(maxlen=window)
+    for paragraph, separator in zip(parts[0::2], parts[1::2] + [""]):
+        if len(paragraph) < 50:  # short lines (headings, captions) are kept as they are
+            kept.append(paragraph + separator)
+            continue
+
+        normalized = " ".join(paragraph.lower().split())
+        if normalized in seen:
+            continue
+
+        shingles = _shingles(paragraph)
+        if any(
+            # Sets this different in size cannot reach the threshold, so skip the intersection
+            min(len(shingles), len(previous)) >= threshold * max(len(shingles), len(previous))
+            and len(shingles & previous) / len(shingles | previous) >= threshold
+            for previous in recent_shingles
+        ):
+            continue
+        kept.append(paragraph + separator)
+        seen.add(normalized)
+        recent_shingles.append(shingles)
+
+    return "".join(kept)
@@ -0,0 +1,156 @@
+"""
+router.py
+
+Latency-aware routing between the Bark and MeloTTS backends.
+
+Classes:
+- RoutingDecision: The chosen backend and the estimates it was based on.
+- BackendRouter: Track queue depth and latency per backend and pick one per request.
+
+Functions:
+- get_router: Return the process-wide backend router.
+"""
+
+# Standard library imports
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict, Optional
+
+# Third-party imports
+from loguru import logger
+
+# Local imports
+from constants import (
+    MELO_TTS_LANGUAGE_MAPPING,
+    ROUTER_BARK_SECONDS_PER_CHAR,
+    ROUTER_DECAY_HALF_LIFE,
+    ROUTER_EWMA_ALPHA,
+    ROUTER_MELO_PARALLELISM,
+    ROUTER_MELO_SECONDS_PER_CHAR,
+    TTS_POOL_WORKERS,
+)
+
+BARK = "bark"
+MELO = "melo"
+
+
+@dataclass
+class RoutingDecision:
+    """The chosen backend and the estimates it was based on."""
+
+    backend: str
+    requested: str
+    reason: str
+    target_seconds: Optional[float] = None
+    estimated_seconds: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def use_advanced_audio(self) -> bool:
+        """Whether the chosen backend is Bark."""
+        return self.backend == BARK
+
+
+class BackendRouter:
+    """Track queue depth and latency per backend and pick one per request.
+
+    The latency average is per character of a single line's synthesis (service time, not
+    time spent queued), since the queue is accounted for separately in `estimate`.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._seconds_per_char = {BARK: ROUTER_BARK_SECONDS_PER_CHAR, MELO: ROUTER_MELO_SECONDS_PER_CHAR}
+        self._fastest = dict(self._seconds_per_char)  # the prior until a line has been observed
+        self._observed = {BARK: False, MELO: False}
+        self._sampled_at = {BARK: time.monotonic(), MELO: time.monotonic()}
+        self._parallelism = {BARK: max(1, TTS_POOL_WORKERS), MELO: ROUTER_MELO_PARALLELISM}
+        self._queued_chars = {BARK: 0, MELO: 0}
+
+    def _current_seconds_per_char(self, backend: str) -> float:
+        """Get the latency average, relaxed toward the fastest seen while no samples arrive. Call with the lock held."""
+        # A backend that is not chosen gets no new samples, so an inflated average
+        # would otherwise never come down again
+        weight = 0.5 ** ((time.monotonic() - self._sampled_at[backend]) / ROUTER_DECAY_HALF_LIFE)
+        fastest = self._fastest[backend]
+        return fastest + (self._seconds_per_char[backend] - fastest) * weight
+
+    def estimate(self, backend: str, characters: int) -> float:
+        """Estimate how long the backend takes to finish its queue plus the given characters."""
+        with self._lock:
+            queued = self._queued_chars[backend]
+            return (queued + characters) * self._current_seconds_per_char(backend) / self._parallelism[backend]
+
+    def choose(
+        self,
+        language: str,
+        characters: int,
+        use_advanced_audio: bool,
+        target_seconds: Optional[float] = None,
+    ) -> RoutingDecision:
+        """Pick a backend for the request, falling back to MeloTTS when Bark would miss the target."""
+        requested = BARK if use_advanced_audio else MELO
+        estimates = {backend: round(self.estimate(backend, characters), 2) for backend in (BARK, MELO)}
+        decision = RoutingDecision(
+            backend=requested,
+            requested=requested,
+            reason="requested",
+            target_seconds=target_seconds,
+            estimated_seconds=estimates,
+        )
+
+        if target_seconds is None or estimates[requested] <= target_seconds:
+            return decision
+        if requested == MELO or language not in MELO_TTS_LANGUAGE_MAPPING:
+            decision.reason = "target_unmet_no_fallback"
+        elif estimates[MELO] < estimates[BARK]:
+            decision.backend = MELO
+            decision.reason = "target_fallback"
+        else:
+            decision.reason = "target_unmet_fallback_slower"
+
+        logger.info(f"TTS routing: {decision}")
+        return decision
+
+    @contextmanager
+    def track(self, backend: str, characters: int):
+        """Count the characters as queued on the backend while the request runs."""
+        with self._lock:
+            self._queued_chars[backend] += characters
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._queued_chars[backend] -= characters
+
+    def record(self, backend: str, characters: int, seconds: float) -> None:
+        """Record how long one line took to synthesize, excluding any time it spent queued."""
+        if characters <= 0:
+            return
+        observed = seconds / characters
+        with self._lock:
+            current = self._current_seconds_per_char(backend)
+            self._seconds_per_char[backend] = current + ROUTER_EWMA_ALPHA * (observed - current)
+            self._sampled_at[backend] = time.monotonic()
+            self._fastest[backend] = min(self._fastest[backend], observed) if self._observed[backend] else observed
+            self._observed[backend] = True
+
+    def stats(self) -> dict:
+        """Report queue depth and per-character latency per backend."""
+        with self._lock:
+            return {
+                backend: {
+                    "queued_chars": self._queued_chars[backend],
+                    "seconds_per_char": round(self._current_seconds_per_char(backend), 4),
+                }
+                for backend in (BARK, MELO)
+            }
+
+
+_router = BackendRouter()
+
+
+def get_router() -> BackendRouter:
+    """Return the process-wide backend router."""
+    return _router
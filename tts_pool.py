@@ -0,0 +1,363 @@
+"""
+tts_pool.py
+
+Bark synthesis worker pool. utils.py starts the pool right after `preload_models()` and
+before it creates the MeloTTS client (whose gradio_client starts background threads), so
+the process has no other Python threads yet. The pool forks a small "zygote" process that
+holds the loaded weights, and every worker (including restarts) is forked from the zygote,
+so the weights are shared copy-on-write and no worker is ever forked from a process with
+live network or web server threads. Each worker talks to the parent over its own connection; the parent
+records which job it handed to which worker, and the PCM comes back through shared memory.
+
+Classes:
+- TTSWorkerPool: Dispatch lines to the workers, restart crashed ones and report health.
+
+Functions:
+- start_tts_pool: Start the process-wide worker pool, if enabled.
+- get_tts_pool: Return the process-wide worker pool, or None if it is not running.
+- _zygote_main: Fork workers on request from the parent.
+- _worker_main: Worker loop run inside each forked process.
+"""
+
+# Standard library imports
+import atexit
+import itertools
+import multiprocessing as mp
+import os
+import signal
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.connection import Client, Listener, wait
+from typing import Dict, Optional
+
+# Third-party imports
+import numpy as np
+import torch
+from bark import generate_audio
+from loguru import logger
+
+# Local imports
+from constants import (
+    TTS_POOL_JOB_TIMEOUT,
+    TTS_POOL_MAX_JOB_ATTEMPTS,
+    TTS_POOL_MONITOR_INTERVAL,
+    TTS_POOL_THREADS_PER_WORKER,
+    TTS_POOL_WORKERS,
+)
+from encoder import to_pcm16
+from router import BARK, get_router
+
+
+def _worker_main(worker_id: int, address: str, authkey: bytes, num_threads: int) -> None:
+    """Receive jobs over the worker's own connection and hand the PCM back via shared memory."""
+    torch.set_num_threads(num_threads)
+    conn = Client(address, authkey=authkey)
+    conn.send(("hello", worker_id, os.getpid()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except EOFError:  # the parent went away
+            break
+        if job is None:  # shutdown sentinel
+            break
+
+        job_id, text, history_prompt = job
+        try:
+            audio_array = generate_audio(text, history_prompt=history_prompt, silent=True)
+            pcm = to_pcm16(audio_array)
+
+            shm = shared_memory.SharedMemory(create=True, size=max(pcm.nbytes, 1))
+            np.ndarray(pcm.shape, dtype=np.int16, buffer=shm.buf)[:] = pcm
+            conn.send(("done", job_id, shm.name, pcm.size))
+            shm.close()  # the parent owns the segment from here on and unlinks it
+        except Exception as e:
+            conn.send(("error", job_id, repr(e), 0))
+
+
+def _zygote_main(control, address: str, authkey: bytes, num_threads: int) -> None:
+    """Fork a worker for every ("spawn", worker_id) request until the parent goes away."""
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)  # let the kernel reap exited workers
+
+    while True:
+        try:
+            message = control.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        _, worker_id = message
+        if os.fork() == 0:
+            signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+            control.close()
+            try:
+                _worker_main(worker_id, address, authkey, num_threads)
+            finally:
+                os._exit(0)
+
+
+class TTSWorkerPool:
+    """Dispatch lines to the forked Bark workers, restart crashed ones and report health."""
+
+    def __init__(self, num_workers: int, threads_per_worker: int = TTS_POOL_THREADS_PER_WORKER):
+        self._num_workers = num_workers
+        authkey = os.urandom(32)
+        self._listener = Listener(family="AF_UNIX", authkey=authkey)
+
+        self._lock = threading.Lock()
+        self._job_ids = itertools.count()
+        self._futures: Dict[int, Future] = {}
+        self._jobs: Dict[int, tuple] = {}
+        self._attempts: Dict[int, int] = {}
+        self._pending = deque()  # job ids not yet handed to a worker
+        self._conns: Dict[int, object] = {}  # worker_id -> connection
+        self._pids: Dict[int, int] = {}
+        self._idle = set()
+        self._assigned: Dict[int, tuple] = {}  # worker_id -> (job_id, assigned at)
+        self._restarts = 0
+        self._completed = 0
+        self._failed = 0
+        self._closed = False
+
+        # Start the tracker before forking so every worker shares it; otherwise each
+        # worker would spawn its own and unlink the segments it created on exit.
+        resource_tracker.ensure_running()
+        control, zygote_control = mp.Pipe()
+        self._zygote = mp.get_context("fork").Process(
+            target=_zygote_main,
+            args=(zygote_control, self._listener.address, authkey, threads_per_worker),
+            name="tts-zygote",
+            daemon=True,
+        )
+        self._zygote.start()
+        zygote_control.close()
+        self._control = control
+
+        for worker_id in range(num_workers):
+            self._control.send(("spawn", worker_id))
+
+        self._acceptor = threading.Thread(target=self._accept, name="tts-pool-acceptor", daemon=True)
+        self._collector = threading.Thread(target=self._collect, name="tts-pool-collector", daemon=True)
+        self._acceptor.start()
+        self._collector.start()
+        logger.info(f"Started TTS worker pool with {num_workers} workers")
+
+    def _accept(self) -> None:
+        """Register each worker as it connects and give it work."""
+        while not self._closed:
+            try:
+                conn = self._listener.accept()
+                _, worker_id, pid = conn.recv()
+            except (OSError, EOFError):
+                if self._closed:
+                    return
+                continue
+            with self._lock:
+                self._conns[worker_id] = conn
+                self._pids[worker_id] = pid
+                self._idle.add(worker_id)
+                self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand pending jobs to idle workers. Must be called with the lock held."""
+        while self._pending and self._idle:
+            worker_id = self._idle.pop()
+            job_id = self._pending.popleft()
+            # Record the assignment before sending, so a crash at any point is attributed
+            self._assigned[worker_id] = (job_id, time.monotonic())
+            try:
+                self._conns[worker_id].send(self._jobs[job_id])
+            except OSError:
+                pass  # the worker is dead; _collect sees its connection close and requeues
+
+    def submit(self, text: str, history_prompt: str) -> Future:
+        """Queue a line for synthesis and return a future resolving to int16 PCM."""
+        future: Future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("TTS worker pool is shut down")
+            job_id = next(self._job_ids)
+            self._futures[job_id] = future
+            self._jobs[job_id] = (job_id, text, history_prompt)
+            self._attempts[job_id] = 1
+            self._pending.append(job_id)
+            self._dispatch()
+        return future
+
+    def synthesize(self, text: str, history_prompt: str) -> np.ndarray:
+        """Synthesize a single line and block until its PCM is available."""
+        return self.submit(text, history_prompt).result(timeout=2 * TTS_POOL_JOB_TIMEOUT)
+
+    def _finish(self, job_id: int) -> Optional[Future]:
+        """Forget a job and return its future. Must be called with the lock held."""
+        self._jobs.pop(job_id, None)
+        self._attempts.pop(job_id, None)
+        return self._futures.pop(job_id, None)
+
+    def _collect(self) -> None:
+        """Resolve futures from worker results, and handle dead or hung workers."""
+        while not self._closed:
+            with self._lock:
+                conns = {conn: worker_id for worker_id, conn in self._conns.items()}
+            for conn in wait(list(conns), timeout=TTS_POOL_MONITOR_INTERVAL):
+                worker_id = conns[conn]
+                try:
+                    kind, job_id, payload, size = conn.recv()
+                except (EOFError, OSError):
+                    self._on_worker_exit(worker_id)
+                    continue
+                self._on_result(worker_id, kind, job_id, payload, size)
+            self._kill_hung_workers()
+
+    def _on_result(self, worker_id: int, kind: str, job_id: int, payload, size: int) -> None:
+        """Resolve the job's future and give the worker its next job."""
+        pcm = None
+        if kind == "done":
+            shm = shared_memory.SharedMemory(name=payload)
+            try:
+                pcm = np.ndarray((size,), dtype=np.int16, buffer=shm.buf).copy()
+            finally:
+                shm.close()
+                shm.unlink()
+
+        with self._lock:
+            assignment = self._assigned.pop(worker_id, None)
+            job = self._jobs.get(job_id)
+            future = self._finish(job_id)
+            if kind == "done":
+                self._completed += 1
+            else:
+                self._failed += 1
+            self._idle.add(worker_id)
+            self._dispatch()
+
+        if kind == "done" and assignment is not None and job is not None:
+            # Time from hand-off to result, so time spent in the pending queue is not counted
+            get_router().record(BARK, len(job[1]), time.monotonic() - assignment[1])
+
+        if future is not None:
+            if kind == "done":
+                future.set_result(pcm)
+            else:
+                future.set_exception(RuntimeError(f"TTS worker {worker_id} failed: {payload}"))
+
+    def _on_worker_exit(self, worker_id: int) -> None:
+        """Requeue or fail the dead worker's job and ask the zygote for a replacement."""
+        failed_future = None
+        with self._lock:
+            conn = self._conns.pop(worker_id, None)
+            if conn is not None:
+                conn.close()
+            self._pids.pop(worker_id, None)
+            self._idle.discard(worker_id)
+            assignment = self._assigned.pop(worker_id, None)
+            if assignment is not None and assignment[0] in self._jobs:
+                job_id = assignment[0]
+                if self._attempts[job_id] < TTS_POOL_MAX_JOB_ATTEMPTS:
+                    self._attempts[job_id] += 1
+                    self._pending.appendleft(job_id)
+                else:
+                    self._failed += 1
+                    failed_future = self._finish(job_id)
+            if self._closed:
+                return
+            self._restarts += 1
+            self._dispatch()
+
+        logger.warning(f"TTS worker {worker_id} exited, restarting")
+        if failed_future is not None:
+            failed_future.set_exception(RuntimeError(f"TTS worker {worker_id} crashed or timed out while synthesizing"))
+        try:
+            self._control.send(("spawn", worker_id))
+        except OSError:
+            logger.error("TTS zygote is gone; the worker cannot be restarted")
+
+    def _kill_hung_workers(self) -> None:
+        """Kill workers stuck on one job for longer than TTS_POOL_JOB_TIMEOUT."""
+        now = time.monotonic()
+        with self._lock:
+            hung = [
+                (worker_id, self._pids.get(worker_id))
+                for worker_id, (_, assigned_at) in self._assigned.items()
+                if now - assigned_at > TTS_POOL_JOB_TIMEOUT
+            ]
+            for worker_id, _ in hung:
+                # A job that hangs a worker is not retried
+                job_id, _ = self._assigned[worker_id]
+                self._attempts[job_id] = TTS_POOL_MAX_JOB_ATTEMPTS
+        for worker_id, pid in hung:
+            if pid is not None:
+                logger.warning(f"TTS worker {worker_id} exceeded {TTS_POOL_JOB_TIMEOUT}s, killing it")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def health(self) -> dict:
+        """Report worker liveness and job counters."""
+        with self._lock:
+            return {
+                "workers": self._num_workers,
+                "alive": len(self._conns),
+                "zygote_alive": self._zygote.is_alive(),
+                "restarts": self._restarts,
+                "pending": len(self._pending),
+                "in_flight": len(self._assigned),
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self) -> None:
+        """Stop the zygote and all workers, and fail any jobs still pending."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            for conn in self._conns.values():
+                try:
+                    conn.send(None)
+                except OSError:
+                    pass
+            futures = list(self._futures.values())
+            self._futures.clear()
+        try:
+            self._control.send(None)
+        except OSError:
+            pass
+        self._zygote.join(timeout=5)
+        self._listener.close()
+        for future in futures:
+            future.set_exception(RuntimeError("TTS worker pool is shut down"))
+
+
+_pool: Optional[TTSWorkerPool] = None
+
+
+def start_tts_pool() -> Optional[TTSWorkerPool]:
+    """Start the process-wide worker pool. Call right after the models are loaded, before any threads start."""
+    global _pool
+    if _pool is not None:
+        return _pool
+    if TTS_POOL_WORKERS <= 0 or "fork" not in mp.get_all_start_methods():
+        return None
+    if torch.cuda.is_available() and torch.cuda.is_initialized():
+        # CUDA state does not survive a fork; run Bark in-process instead.
+        return None
+
+    if threading.active_count() > 1:
+        logger.warning(
+            f"Starting the TTS worker pool with {threading.active_count() - 1} other threads running; "
+            "it should be started before anything spawns threads"
+        )
+    _pool = TTSWorkerPool(TTS_POOL_WORKERS)
+    atexit.register(_pool.shutdown)
+    return _pool
+
+
+def get_tts_pool() -> Optional[TTSWorkerPool]:
+    """Return the process-wide worker pool, or None if it is disabled or unsupported."""
+    return _pool
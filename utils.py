@@ -3,25 +3,26 @@ utils.py
 
 Functions:
 - generate_script: Get the dialogue from the LLM.
-- call_llm: Call the LLM with the given prompt and dialogue format.
+- call_llm: Call the LLM with the given prompt and dialogue format, through the rate-limited dispatcher.
 - parse_url: Parse the given URL and return the text content.
 - generate_podcast_audio: Generate audio for podcast using TTS or advanced audio models.
-- _use_suno_model: Generate advanced audio using Bark.
+- generate_podcast_audio_batch: Generate audio for all dialogue lines, in parallel when the TTS pool is enabled.
+- _use_suno_model: Generate advanced audio using Bark, as 16-bit PCM samples.
+- _get_bark_history_prompt: Get the Bark voice preset for a speaker.
 - _use_melotts_api: Generate audio using TTS model.
 - _get_melo_tts_params: Get TTS parameters based on speaker and language.
 """
 
 # Standard library imports
 import time
-from typing import Any, Union
+from typing import Any, List, Tuple, Union
 
 # Third-party imports
 import requests
 from loguru import logger
-from bark import SAMPLE_RATE, generate_audio, preload_models
+import numpy as np
+from bark import generate_audio, preload_models
 from gradio_client import Client
-from scipy.io.wavfile import write as write_wav
-import backoff
 from urllib3.util.retry import Retry
 import urllib3
 import json
@@ -40,15 +41,25 @@ from constants import (
     JINA_RETRY_ATTEMPTS,
     JINA_RETRY_DELAY,
     DEEPSEEK_BASE_URL,
+    LLM_PRIORITY_INTERACTIVE,
+    TTS_POOL_JOB_TIMEOUT,
 )
+from encoder import to_pcm16
+from llm_dispatch import get_llm_dispatcher
+from router import BARK, MELO, get_router
 from schema import ShortDialogue, MediumDialogue
-
-# Initialize Hugging Face client
-hf_client = Client(MELO_TTS_SPACES_ID)
+from tts_pool import get_tts_pool, start_tts_pool
 
 # Download and load all models for Bark
 preload_models()
 
+# Fork the Bark workers now, while the weights are loaded and before anything starts a thread
+start_tts_pool()
+
+# Initialize Hugging Face client. It starts telemetry and heartbeat threads, so it must
+# come after the pool has forked
+hf_client = Client(MELO_TTS_SPACES_ID)
+
 # 禁用不安全的 HTTPS 警告
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
@@ -73,19 +84,20 @@ def generate_script(
     system_prompt: str,
     input_text: str,
     output_model: Union[ShortDialogue, MediumDialogue],
+    priority: int = LLM_PRIORITY_INTERACTIVE,
 ) -> Union[ShortDialogue, MediumDialogue]:
     """获取对话脚本，带有错误重试"""
     try:
-        first_draft_dialogue = call_llm(system_prompt, input_text, output_model)
+        first_draft_dialogue = call_llm(system_prompt, input_text, output_model, priority)
         
         # 添加改进提示
         improvement_prompt = f"{system_prompt}\n\n这是第一版对话:\n\n{first_draft_dialogue.model_dump_json()}\n\n请改进对话，使其更自然流畅。"
-        final_dialogue = call_llm(improvement_prompt, "请优化对话内容", output_model)
+        final_dialogue = call_llm(improvement_prompt, "请优化对话内容", output_model, priority)
         
         return final_dialogue
     except Exception as e:
         logger.error(f"生成对话脚本失败: {str(e)}")
-        raise gr.Error("生成对话时出错，请稍后重试")
+        raise RuntimeError("生成对话时出错，请稍后重试") from e
 
 def call_api(system_prompt: str, text: str) -> dict:
     """直接调用 DeepSeek API"""
@@ -118,16 +130,12 @@ def call_api(system_prompt: str, text: str) -> dict:
         logger.error(f"API 调用失败: {str(e)}")
         raise
 
-@backoff.on_exception(
-    backoff.expo,
-    Exception,
-    max_tries=3,
-    max_time=30
-)
-def call_llm(system_prompt: str, text: str, dialogue_format: Any) -> Any:
-    """调用 LLM 并处理响应"""
+def call_llm(
+    system_prompt: str, text: str, dialogue_format: Any, priority: int = LLM_PRIORITY_INTERACTIVE
+) -> Any:
+    """调用 LLM 并处理响应（限流与重试由 dispatcher 负责，解析和校验错误不重试）"""
     try:
-        response = call_api(system_prompt, text)
+        response = get_llm_dispatcher().dispatch(call_api, system_prompt, text, priority)
         result = response['choices'][0]['message']['content']
         logger.debug(f"API 返回结果: {result}")
         
@@ -169,24 +177,51 @@ def parse_url(url: str) -> str:
 
 def generate_podcast_audio(
     text: str, speaker: str, language: str, use_advanced_audio: bool, random_voice_number: int
-) -> str:
-    """Generate audio for podcast using TTS or advanced audio models."""
+) -> Union[str, np.ndarray]:
+    """Generate audio for podcast using TTS or advanced audio models: Bark PCM samples or a MeloTTS file."""
     if use_advanced_audio:
         return _use_suno_model(text, speaker, language, random_voice_number)
     else:
         return _use_melotts_api(text, speaker, language)
 
-def _use_suno_model(text: str, speaker: str, language: str, random_voice_number: int) -> str:
-    """Generate advanced audio using Bark."""
+def generate_podcast_audio_batch(
+    lines: List[Tuple[str, str]], language: str, use_advanced_audio: bool, random_voice_number: int
+) -> List[Union[str, np.ndarray]]:
+    """Generate audio for all (text, speaker) lines, in parallel when the TTS pool is enabled."""
+    pool = get_tts_pool() if use_advanced_audio else None
+    if pool is None:
+        return [
+            generate_podcast_audio(text, speaker, language, use_advanced_audio, random_voice_number)
+            for text, speaker in lines
+        ]
+
+    # Submit every line up front so the workers can synthesize them concurrently
+    futures = [
+        pool.submit(text, _get_bark_history_prompt(speaker, language, random_voice_number))
+        for text, speaker in lines
+    ]
+    logger.info(f"TTS pool health: {pool.health()}")
+    # The pool kills workers stuck past TTS_POOL_JOB_TIMEOUT; this bound is the backstop
+    # for lines that never reach a worker (e.g. every worker is down)
+    return [future.result(timeout=2 * TTS_POOL_JOB_TIMEOUT) for future in futures]
+
+def _use_suno_model(text: str, speaker: str, language: str, random_voice_number: int) -> np.ndarray:
+    """Generate advanced audio using Bark, as 16-bit PCM samples at Bark's sample rate."""
+    history_prompt = _get_bark_history_prompt(speaker, language, random_voice_number)
+    pool = get_tts_pool()
+    if pool is not None:
+        return pool.synthesize(text, history_prompt)
+
+    start_time = time.time()
+    audio_array = generate_audio(text, history_prompt=history_prompt)
+    get_router().record(BARK, len(text), time.time() - start_time)
+    return to_pcm16(audio_array)
+
+def _get_bark_history_prompt(speaker: str, language: str, random_voice_number: int) -> str:
+    """Get the Bark voice preset for a speaker."""
     host_voice_num = str(random_voice_number)
     guest_voice_num = str(random_voice_number + 1)
-    audio_array = generate_audio(
-        text,
-        history_prompt=f"v2/{language}_speaker_{host_voice_num if speaker == 'Host (Jane)' else guest_voice_num}",
-    )
-    file_path = f"audio_{language}_{speaker}.mp3"
-    write_wav(file_path, SAMPLE_RATE, audio_array)
-    return file_path
+    return f"v2/{language}_speaker_{host_voice_num if speaker == 'Host (Jane)' else guest_voice_num}"
 
 def _use_melotts_api(text: str, speaker: str, language: str) -> str:
     """Generate audio using TTS model."""
@@ -194,13 +229,16 @@ def _use_melotts_api(text: str, speaker: str, language: str) -> str:
 
     for attempt in range(MELO_RETRY_ATTEMPTS):
         try:
-            return hf_client.predict(
+            start_time = time.time()
+            audio_path = hf_client.predict(
                 text=text,
                 language=language,
                 speaker=accent,
                 speed=speed,
                 api_name=MELO_API_NAME,
             )
+            get_router().record(MELO, len(text), time.time() - start_time)
+            return audio_path
         except Exception as e:
             if attempt == MELO_RETRY_ATTEMPTS - 1:  # Last attempt
                 raise  # Re-raise the last exception if all attempts fail